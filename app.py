@@ -1,31 +1,26 @@
 # app.py — ג'ירף – איכויות מזון (Landing עם רקע ענברי, קוביות ירוקות בהירות חדשות, Daily Pick טרי בכל כניסה)
 from __future__ import annotations
-import os, json, sqlite3
+import os, re, json, sqlite3, time, bisect, threading
+from collections import Counter, deque
+from collections.abc import Mapping
 from datetime import datetime
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, Callable, NamedTuple
 
 import pandas as pd
 import streamlit as st
-import altair as alt
-
-# ===== Google Sheets (אופציונלי) =====
-try:
-    import gspread
-    from google.oauth2.service_account import Credentials
-    GSHEETS_AVAILABLE = True
-except Exception:
-    GSHEETS_AVAILABLE = False
+# altair / gspread / openai נטענים בעצלות – רק בעמודים שמשתמשים בהם
 
 # =========================
 # ------- SETTINGS --------
 # =========================
 st.set_page_config(page_title="ג'ירף – איכויות מזון", layout="wide")
 
-BRANCHES: List[str] = [
+# רשימות ברירת מחדל – נזרעות לטבלאות branches/dishes/chefs במיגרציה; משם והלאה הנתונים חיים ב-DB
+SEED_BRANCHES: List[str] = [
     "חיפה", "ראשל״צ", "רמה״ח", "נס ציונה", "לנדמרק", "פתח תקווה", "הרצליה", "סביון"
 ]
 
-DISHES: List[str] = [
+SEED_DISHES: List[str] = [
     "פאד תאי", "מלאזית", "פיליפינית", "אפגנית",
     "קארי דלעת", "סצ'ואן", "ביף רייס",
     "אורז מטוגן", "מאקי סלמון", "מאקי טונה",
@@ -33,7 +28,7 @@ DISHES: List[str] = [
     "סלט תאילנדי", "סלט בריאות", "סלט דג לבן", "אגרול", "גיוזה", "וון",
 ]
 
-CHEFS_BY_BRANCH: Dict[str, List[str]] = {
+SEED_CHEFS_BY_BRANCH: Dict[str, List[str]] = {
     "פתח תקווה": ["שן", "זאנג", "דאי", "לי", "ין", "יו"],
     "הרצליה": ["יון", "שיגווה", "באו באו", "האו", "טו", "זאנג", "טאנג", "צונג"],
     "נס ציונה": ["לי פנג", "זאנג", "צ'ו", "פנג"],
@@ -52,12 +47,16 @@ MIN_CHEF_TOP_M  = 5
 MIN_CHEF_WEEK_M = 2
 MIN_DISH_WEEK_M = 2
 
+# ספקי ניתוח מרוחקים: תקציב זמן (שניות) + השהיה אחרי כשל. הספק המקומי תמיד זמין, בלי תקציב.
+LLM_BUDGET_S: Dict[str, float] = {"openai": 20.0}
+LLM_COOLDOWN_S = 120
+
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
 
 # =========================
 # ---------- STYLE --------
 # =========================
-st.markdown("""
+_STYLE_CSS = """
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Rubik:wght@300;400;500;700;900&display=swap');
 
@@ -152,13 +151,23 @@ table.small th {font-weight:900; color:#000;}
 /* הסתרת “Press Enter to apply” */
 div[data-testid="stWidgetInstructions"]{display:none !important;}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def style_css() -> str:
+    # מוסר הערות ורווחים פעם אחת לתהליך – פחות בתים בכל rerun
+    css = re.sub(r"/\*.*?\*/", "", _STYLE_CSS, flags=re.S)
+    return "\n".join(line.strip() for line in css.splitlines() if line.strip())
+
+st.markdown(style_css(), unsafe_allow_html=True)
 
 # =========================
 # ------- DATABASE --------
 # =========================
 def conn() -> sqlite3.Connection:
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = sqlite3.connect(DB_PATH, check_same_thread=False)
+    c.execute("PRAGMA foreign_keys = ON")
+    return c
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS food_quality (
@@ -177,77 +186,238 @@ INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_food_chef_dish_time ON food_quality(chef_name, dish_name, created_at)",
 ]
 
-def init_db():
+# --- v2: טבלאות מימד + מפתחות זרים שלמים ב-food_quality ---
+DIM_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS branches (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS dishes (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE IF NOT EXISTS chefs (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    # גרסת נתוני הייחוס – עולה בכל כתיבה לטבלאות המימד (ref() נטען מחדש רק כשהיא משתנה)
+    "CREATE TABLE IF NOT EXISTS ref_meta (version INTEGER NOT NULL)",
+    "INSERT INTO ref_meta (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM ref_meta)",
+    """CREATE TABLE IF NOT EXISTS chef_branches (
+  chef_id INTEGER NOT NULL REFERENCES chefs(id),
+  branch_id INTEGER NOT NULL REFERENCES branches(id),
+  PRIMARY KEY (branch_id, chef_id)
+)""",
+]
+SCHEMA_V2 = """
+CREATE TABLE food_quality_v2 (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  branch_id INTEGER NOT NULL REFERENCES branches(id),
+  chef_id INTEGER NOT NULL REFERENCES chefs(id),
+  dish_id INTEGER NOT NULL REFERENCES dishes(id),
+  score INTEGER NOT NULL CHECK(score BETWEEN 1 AND 10),
+  notes TEXT,
+  created_at TEXT NOT NULL DEFAULT (CURRENT_TIMESTAMP),
+  submitted_by TEXT
+);
+"""
+INDEXES_V2 = [
+    "CREATE INDEX IF NOT EXISTS idx_food_branch_time ON food_quality(branch_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_food_chef_dish_time ON food_quality(chef_id, dish_id, created_at)",
+]
+
+# גרש/גרשיים בכל הכתיבים (׳ ’ ` / ״ “ ”) מאוחדים לצורה שברשימות הזרע: ' ו-״
+_QUOTE_MAP = str.maketrans({"׳": "'", "’": "'", "‘": "'", "`": "'", '"': "״", "“": "״", "”": "״"})
+
+def norm_name(name: str) -> str:
+    # מאחד רווחים וגרשים כדי ששמות שהוקלדו ידנית לא ייצרו וריאנטים
+    return " ".join((name or "").translate(_QUOTE_MAP).split())
+
+def bump_ref_version(cur: sqlite3.Cursor):
+    cur.execute("UPDATE ref_meta SET version = version + 1")
+
+def dim_id(cur: sqlite3.Cursor, table: str, name: str) -> int:
+    name = norm_name(name)
+    cur.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+    if cur.rowcount == 1: bump_ref_version(cur)
+    return cur.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+
+def add_chef_to_branch(cur: sqlite3.Cursor, branch: str, chef: str) -> int:
+    chef_id = dim_id(cur, "chefs", chef)
+    cur.execute("INSERT OR IGNORE INTO chef_branches (chef_id, branch_id) VALUES (?, ?)",
+                (chef_id, dim_id(cur, "branches", branch)))
+    if cur.rowcount == 1: bump_ref_version(cur)
+    return chef_id
+
+def _migrate_to_dimensions(cur: sqlite3.Cursor):
+    for b in SEED_BRANCHES: dim_id(cur, "branches", b)
+    for d in SEED_DISHES: dim_id(cur, "dishes", d)
+    for b, chefs in SEED_CHEFS_BY_BRANCH.items():
+        for ch in chefs: add_chef_to_branch(cur, b, ch)
+    cur.execute(SCHEMA_V2)
+    ids: Dict[Tuple[str, str], int] = {}
+    def lookup(table: str, name: str) -> int:
+        key = (table, norm_name(name))
+        if key not in ids: ids[key] = dim_id(cur, table, name)
+        return ids[key]
+    rows = cur.execute(
+        "SELECT id, branch, chef_name, dish_name, score, notes, created_at, submitted_by FROM food_quality").fetchall()
+    cur.executemany(
+        "INSERT INTO food_quality_v2 (id, branch_id, chef_id, dish_id, score, notes, created_at, submitted_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(r[0], lookup("branches", r[1]), lookup("chefs", r[2]), lookup("dishes", r[3])) + tuple(r[4:]) for r in rows],
+    )
+
+# מיגרציות לפי גרסה (PRAGMA user_version) – MIGRATIONS[i] מעלה את הקובץ לגרסה i+1.
+# כל צעד הוא SQL או פונקציה שמקבלת cursor.
+MIGRATIONS: List[List[Any]] = [
+    [SCHEMA] + INDEXES,
+    DIM_SCHEMA + [_migrate_to_dimensions,
+                  "DROP TABLE food_quality",
+                  "ALTER TABLE food_quality_v2 RENAME TO food_quality"] + INDEXES_V2,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+@st.cache_resource
+def init_db() -> int:
     c = conn(); cur = c.cursor()
-    cur.execute(SCHEMA)
-    for q in INDEXES: cur.execute(q)
-    c.commit(); c.close()
+    version = cur.execute("PRAGMA user_version").fetchone()[0]
+    for i in range(version, SCHEMA_VERSION):
+        for q in MIGRATIONS[i]:
+            if callable(q): q(cur)
+            else: cur.execute(q)
+        cur.execute(f"PRAGMA user_version = {i + 1}")
+        c.commit()
+    c.close()
+    return SCHEMA_VERSION
 init_db()
 
+# =========================
+# ---- REFERENCE DATA -----
+# =========================
+class RefData(NamedTuple):
+    branch_names: Dict[int, str]
+    chef_names: Dict[int, str]
+    dish_names: Dict[int, str]
+    branches: List[str]
+    dishes: List[str]
+    chefs_by_branch: Dict[str, List[str]]
+
+def ref_version() -> int:
+    c = conn()
+    v = c.execute("SELECT version FROM ref_meta").fetchone()[0]
+    c.close()
+    return int(v)
+
+@st.cache_resource(max_entries=2)
+def _load_ref(version: int) -> RefData:
+    c = conn()
+    branch_names = dict(c.execute("SELECT id, name FROM branches ORDER BY id").fetchall())
+    chef_names   = dict(c.execute("SELECT id, name FROM chefs ORDER BY id").fetchall())
+    dish_names   = dict(c.execute("SELECT id, name FROM dishes ORDER BY id").fetchall())
+    chefs_by_branch: Dict[str, List[str]] = {}
+    for b, ch in c.execute("SELECT b.name, c.name FROM chef_branches cb JOIN branches b ON b.id = cb.branch_id "
+                           "JOIN chefs c ON c.id = cb.chef_id ORDER BY cb.rowid"):
+        chefs_by_branch.setdefault(b, []).append(ch)
+    c.close()
+    return RefData(branch_names, chef_names, dish_names,
+                   list(branch_names.values()), list(dish_names.values()), chefs_by_branch)
+
+def ref() -> RefData:
+    return _load_ref(ref_version())
+
+def register_chef(branch: str, chef: str):
+    c = conn(); cur = c.cursor()
+    add_chef_to_branch(cur, branch, chef)
+    c.commit(); c.close()
+
+# נקרא פעם אחת בכל ריצה; שאר הדף משתמש ב-ref_data
+ref_data = ref()
+
 # =========================
 # -------- HELPERS --------
 # =========================
-@st.cache_data(ttl=15)
-def load_df() -> pd.DataFrame:
+def _read_food_quality() -> pd.DataFrame:
     c = conn()
     df = pd.read_sql_query(
-        "SELECT id, branch, chef_name, dish_name, score, notes, created_at FROM food_quality ORDER BY created_at DESC",
+        "SELECT id, branch_id, chef_id, dish_id, score, notes, created_at FROM food_quality ORDER BY created_at DESC",
         c,
     )
     c.close()
+    # שמות כ-category: הקודים השלמים משמשים ל-groupby, הטקסט נשמר פעם אחת לכל ערך.
+    # ref() ולא ref_data – רץ רק כש-load_df מחמיץ cache, ואחרי הכנסה ייתכן טבח חדש
+    r = ref()
+    for col, id_col, names in (("branch", "branch_id", r.branch_names),
+                               ("chef_name", "chef_id", r.chef_names),
+                               ("dish_name", "dish_id", r.dish_names)):
+        df[col] = pd.Categorical(df.pop(id_col).map(names), categories=list(names.values()))
     if "created_at" in df.columns:
         df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
-    return df
+    return df.reindex(columns=["id", "branch", "chef_name", "dish_name", "score", "notes", "created_at"])
+
+@st.cache_data(ttl=15)
+def load_df() -> pd.DataFrame:
+    return _read_food_quality()
 
 # טעינה טרייה – לעקוף cache כשנכנסים לעמוד הפתיחה כדי שהמנה היומית תהיה עדכנית
 def load_df_fresh() -> pd.DataFrame:
-    c = conn()
-    df = pd.read_sql_query(
-        "SELECT id, branch, chef_name, dish_name, score, notes, created_at FROM food_quality ORDER BY created_at DESC",
-        c,
-    )
-    c.close()
-    if "created_at" in df.columns:
-        df["created_at"] = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
-    return df
+    return _read_food_quality()
+
+def get_setting(name: str) -> Any:
+    # בלי .streamlit/secrets.toml הגישה ל-st.secrets זורקת – נופלים למשתני סביבה.
+    # מחרוזת, או Mapping כשהמפתח הוא טבלה ב-secrets.toml
+    try:
+        val = st.secrets.get(name)
+    except Exception:
+        val = None
+    return val or os.getenv(name)
 
 def _get_sheet_id() -> Optional[str]:
-    sid = st.secrets.get("GOOGLE_SHEET_ID") or os.getenv("GOOGLE_SHEET_ID")
+    sid = get_setting("GOOGLE_SHEET_ID")
     if sid: return sid
-    url = st.secrets.get("GOOGLE_SHEET_URL") or os.getenv("GOOGLE_SHEET_URL")
+    url = get_setting("GOOGLE_SHEET_URL")
     if url and "/spreadsheets/d/" in url:
         try: return url.split("/spreadsheets/d/")[1].split("/")[0]
         except Exception: return None
     return None
 
 def _get_service_account_info() -> Optional[dict]:
-    raw = (st.secrets.get("GOOGLE_SERVICE_ACCOUNT_JSON")
-           or os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
-           or st.secrets.get("google_service_account")
-           or os.getenv("GOOGLE_SERVICE_ACCOUNT"))
+    raw = (get_setting("GOOGLE_SERVICE_ACCOUNT_JSON")
+           or get_setting("google_service_account")
+           or get_setting("GOOGLE_SERVICE_ACCOUNT"))
     if not raw: return None
-    if isinstance(raw, dict): return raw
+    # [google_service_account] ב-secrets.toml מגיע כ-AttrDict (Mapping, לא dict)
+    if isinstance(raw, Mapping): return dict(raw)
     try: return json.loads(raw)
     except Exception: return None
 
 def insert_record(branch: str, chef: str, dish: str, score: int, notes: str = "", submitted_by: Optional[str] = None):
     timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    branch, chef, dish = norm_name(branch), norm_name(chef), norm_name(dish)
     c = conn(); cur = c.cursor()
     cur.execute(
-        "INSERT INTO food_quality (branch, chef_name, dish_name, score, notes, created_at, submitted_by) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (branch.strip(), chef.strip(), dish.strip(), int(score), (notes or "").strip(), timestamp, submitted_by),
+        "INSERT INTO food_quality (branch_id, chef_id, dish_id, score, notes, created_at, submitted_by) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (dim_id(cur, "branches", branch), dim_id(cur, "chefs", chef), dim_id(cur, "dishes", dish),
+         int(score), (notes or "").strip(), timestamp, submitted_by),
     )
+    row_id = cur.lastrowid
     c.commit(); c.close()
+    ts = pd.Timestamp(timestamp, tz="UTC")
+    lbs = leaderboards()
+    lbs["chef"].add(row_id, ts, chef, branch, int(score))
+    lbs["dish"].add(row_id, ts, dish, branch, int(score))
     try:
         save_to_google_sheets(branch, chef, dish, score, notes, timestamp)
     except Exception as e:
         st.warning(f"נשמר מקומית, אך לא לגיליון: {e}")
 
+# ===== Google Sheets (אופציונלי) – נבדק פעם אחת לתהליך, לפני כל קריאת הגדרות =====
+@st.cache_resource
+def _gsheets_available() -> bool:
+    try:
+        import gspread
+        from google.oauth2.service_account import Credentials
+        return True
+    except Exception:
+        return False
+
 def save_to_google_sheets(branch: str, chef: str, dish: str, score: int, notes: str, timestamp: str):
-    if not GSHEETS_AVAILABLE: return
+    if not _gsheets_available(): return
     sheet_id = _get_sheet_id()
     creds_info = _get_service_account_info()
     if not (sheet_id and creds_info): return
+    import gspread
+    from google.oauth2.service_account import Credentials
     credentials = Credentials.from_service_account_info(creds_info, scopes=SCOPES)
     gc = gspread.authorize(credentials)
     gc.open_by_key(sheet_id).sheet1.append_row([timestamp, branch, chef, dish, score, notes or ""])
@@ -264,50 +434,125 @@ def last7(df: pd.DataFrame) -> pd.DataFrame:
     start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=7)
     return df[df["created_at"] >= start].copy()
 
-def worst_network_dish_last7(df: pd.DataFrame, min_count: int = MIN_DISH_WEEK_M
-                             ) -> Tuple[Optional[str], Optional[float], int]:
-    d = last7(df)
-    if d.empty: return None, None, 0
-    g = d.groupby("dish_name").agg(n=("id","count"), avg=("score","mean")).reset_index()
-    g = g[g["n"] >= min_count]
-    if g.empty: return None, None, 0
-    row = g.loc[g["avg"].idxmin()]
-    return str(row["dish_name"]), float(row["avg"]), int(row["n"])
+# === 7 הימים שלפני כן (להשוואת מגמה) ===
+def prev7(df: pd.DataFrame) -> pd.DataFrame:
+    if df.empty: return df
+    now = pd.Timestamp.now(tz="UTC")
+    return df[(df["created_at"] >= now - pd.Timedelta(days=14)) & (df["created_at"] < now - pd.Timedelta(days=7))]
 
 def network_branch_avgs_last7(df: pd.DataFrame) -> pd.DataFrame:
     d = last7(df)
     if d.empty: return pd.DataFrame(columns=["branch","avg"])
-    g = d.groupby("branch")["score"].mean().reset_index().rename(columns={"score":"avg"})
+    g = d.groupby("branch", observed=True)["score"].mean().reset_index().rename(columns={"score":"avg"})
     return g.sort_values("avg", ascending=False)
 
-def network_top_chef_last7(df: pd.DataFrame, min_n: int) -> Tuple[Optional[str], Optional[str], Optional[float], int]:
-    d = last7(df)
-    if d.empty: return None, None, None, 0
-    g = d.groupby("chef_name").agg(n=("id","count"), avg=("score","mean")).reset_index()
-    g = g[g["n"] >= min_n]
-    if g.empty: return None, None, None, 0
-    row = g.loc[g["avg"].idxmax()]
-    chef = str(row["chef_name"]); avg = float(row["avg"]); n = int(row["n"])
-    try:
-        branch_mode = d[d["chef_name"] == chef]["branch"].mode().iat[0]
-    except Exception:
-        branch_mode = None
-    return chef, (None if branch_mode is None else str(branch_mode)), avg, n
-
-def network_best_worst_dish_last7(df: pd.DataFrame, min_n: int
-                                  ) -> Tuple[Optional[Tuple[str,float,int]], Optional[Tuple[str,float,int]]]:
-    d = last7(df)
-    if d.empty: return None, None
-    g = d.groupby("dish_name").agg(n=("id","count"), avg=("score","mean")).reset_index()
-    g = g[g["n"] >= min_n]
-    if g.empty: return None, None
-    best = g.loc[g["avg"].idxmax()]
-    worst = g.loc[g["avg"].idxmin()]
-    best_t = (str(best["dish_name"]), float(best["avg"]), int(best["n"]))
-    worst_t = (str(worst["dish_name"]), float(worst["avg"]), int(worst["n"]))
-    if best_t[0] == worst_t[0]:
-        return best_t, None
-    return best_t, worst_t
+# === לוח דירוג מתגלגל (טבחים/מנות) – מתעדכן בהכנסה, בלי לסרוק את הטבלה ===
+class RollingLeaderboard:
+    """דירוג לפי ממוצע בחלון זמן מתגלגל. רק ישויות עם min_n בדיקות לפחות נכנסות לדירוג.
+    הדירוג נשמר כרשימה ממוינת של (-avg, name): top/bottom ודירוג ב-O(log n) באמצעות bisect;
+    עדכון (insort/del) הוא O(n) בהזזת הרשימה – זניח למספר הטבחים/המנות ברשת."""
+
+    def __init__(self, min_n: int, window: pd.Timedelta = pd.Timedelta(days=7)):
+        self.min_n = min_n
+        self.window = window
+        self._events: deque = deque()           # (ts, id, name, branch, score) לפי סדר זמן
+        self._ids: set = set()
+        self._sum: Dict[str, int] = {}
+        self._n: Dict[str, int] = {}
+        self._branches: Dict[str, Counter] = {}
+        self._keys: Dict[str, Tuple[float, str]] = {}
+        self._ranked: List[Tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def _unrank(self, name: str):
+        key = self._keys.pop(name, None)
+        if key is not None:
+            del self._ranked[bisect.bisect_left(self._ranked, key)]
+
+    def _rerank(self, name: str):
+        self._unrank(name)
+        n = self._n.get(name, 0)
+        if n >= self.min_n:
+            key = (-self._sum[name] / n, name)
+            bisect.insort(self._ranked, key)
+            self._keys[name] = key
+
+    def _apply(self, name: str, branch: str, score: int, sign: int):
+        self._sum[name] = self._sum.get(name, 0) + sign * score
+        self._n[name] = self._n.get(name, 0) + sign
+        self._branches.setdefault(name, Counter())[branch] += sign
+        if self._n[name] <= 0:
+            self._sum.pop(name); self._n.pop(name); self._branches.pop(name)
+        elif self._branches[name][branch] <= 0:
+            del self._branches[name][branch]
+        self._rerank(name)
+
+    def _expire(self, now: pd.Timestamp):
+        start = now - self.window
+        while self._events and self._events[0][0] < start:
+            _, row_id, name, branch, score = self._events.popleft()
+            self._ids.discard(row_id)
+            self._apply(name, branch, score, -1)
+
+    def add(self, row_id: int, ts: pd.Timestamp, name: str, branch: str, score: int):
+        # הכנסות מגיעות בסדר זמן (טעינה ממוינת, ואז בדיקות חדשות עם חותמת "עכשיו")
+        with self._lock:
+            if row_id in self._ids: return
+            self._ids.add(row_id)
+            self._events.append((ts, row_id, name, branch, int(score)))
+            self._apply(name, branch, int(score), +1)
+
+    def top(self, k: int = 1) -> List[Tuple[str, float, int]]:
+        with self._lock:
+            self._expire(pd.Timestamp.now(tz="UTC"))
+            return [(name, -neg, self._n[name]) for neg, name in self._ranked[:k]]
+
+    def bottom(self, k: int = 1) -> List[Tuple[str, float, int]]:
+        # מהממוצע הנמוך למעלה; בתיקו – לפי שם בסדר עולה, כמו ב-top
+        with self._lock:
+            self._expire(pd.Timestamp.now(tz="UTC"))
+            out: List[Tuple[float, str]] = []
+            i = len(self._ranked)
+            while i > 0 and len(out) < k:
+                j = bisect.bisect_left(self._ranked, (self._ranked[i - 1][0], ""))
+                out.extend(self._ranked[j:i]); i = j
+            return [(name, -neg, self._n[name]) for neg, name in out[:k]]
+
+    def rank(self, name: str) -> Optional[int]:
+        """דירוג (1 = הגבוה ביותר), או None אם הישות מתחת לסף min_n."""
+        with self._lock:
+            self._expire(pd.Timestamp.now(tz="UTC"))
+            key = self._keys.get(name)
+            return None if key is None else bisect.bisect_left(self._ranked, key) + 1
+
+    def main_branch(self, name: str) -> Optional[str]:
+        with self._lock:
+            c = self._branches.get(name)
+            # הסניף השכיח; בתיקו – לפי שם בסדר עולה
+            return min(c, key=lambda b: (-c[b], b)) if c else None
+
+@st.cache_resource
+def leaderboards() -> Dict[str, RollingLeaderboard]:
+    lbs = {"chef": RollingLeaderboard(MIN_CHEF_WEEK_M), "dish": RollingLeaderboard(MIN_DISH_WEEK_M)}
+    d = last7(load_df_fresh()).dropna(subset=["created_at"]).sort_values(["created_at", "id"])
+    for r in d.itertuples(index=False):
+        lbs["chef"].add(int(r.id), r.created_at, str(r.chef_name), str(r.branch), int(r.score))
+        lbs["dish"].add(int(r.id), r.created_at, str(r.dish_name), str(r.branch), int(r.score))
+    return lbs
+
+def network_top_chef_last7() -> Tuple[Optional[str], Optional[str], Optional[float], int]:
+    lb = leaderboards()["chef"]
+    top = lb.top(1)
+    if not top: return None, None, None, 0
+    chef, avg, n = top[0]
+    return chef, lb.main_branch(chef), avg, n
+
+def network_best_worst_dish_last7() -> Tuple[Optional[Tuple[str,float,int]], Optional[Tuple[str,float,int]]]:
+    lb = leaderboards()["dish"]
+    best, worst = lb.top(1), lb.bottom(1)
+    if not best: return None, None
+    if best[0][0] == worst[0][0]: return best[0], None
+    return best[0], worst[0]
 
 # =========================
 # ------ QUERY PARAMS -----
@@ -349,10 +594,10 @@ def render_landing():
     # כותרת בעמוד פתיחה – ענבר
     st.markdown('<div class="header-landing"><p class="title">ג׳ירף – איכויות מזון</p></div>', unsafe_allow_html=True)
 
-    # מנה יומית טרייה (לעקוף cache בכל כניסה)
-    df_login = load_df_fresh()
-    name, avg, n = worst_network_dish_last7(df_login, MIN_DISH_WEEK_M)
-    if name:
+    # מנה יומית טרייה – מלוח הדירוג המתגלגל (מתעדכן בכל הכנסה)
+    worst = leaderboards()["dish"].bottom(1)
+    if worst:
+        name, avg, n = worst[0]
         st.markdown(
             f"<div class='daily-pick-login'><div class='ttl'>מנה יומית לבדיקה</div>"
             f"<div class='dish'>{name}</div>"
@@ -363,9 +608,13 @@ def render_landing():
                     unsafe_allow_html=True)
 
     # קוביות 3×3
-    items = ["מטה"] + BRANCHES
+    st.markdown(landing_grid_html(tuple(ref_data.branches)), unsafe_allow_html=True)
+
+@st.cache_resource
+def landing_grid_html(branches: Tuple[str, ...]) -> str:
+    items = ["מטה"] + list(branches)
     links = "".join([f"<a class='branch-card' href='?select={item}'>{item}</a>" for item in items])
-    st.markdown(f"<div class='branch-grid'>{links}</div>", unsafe_allow_html=True)
+    return f"<div class='branch-grid'>{links}</div>"
 
 def consume_select_param():
     sel = qp_get("select")
@@ -373,7 +622,7 @@ def consume_select_param():
         return False
     if sel == "מטה":
         st.session_state.auth = {"role": "meta", "branch": None}
-    elif sel in BRANCHES:
+    elif sel in ref_data.branches:
         st.session_state.auth = {"role": "branch", "branch": sel}
     qp_clear()
     safe_rerun()
@@ -407,7 +656,7 @@ df = load_df()
 # בחירת סניף להזנה (מטה)
 if auth["role"] == "meta":
     st.markdown("#### בחירת סניף להזנה (מטה)")
-    st.selectbox("בחר/י סניף להזנה", options=["— בחר —"] + BRANCHES, index=0, key="meta_branch_select")
+    st.selectbox("בחר/י סניף להזנה", options=["— בחר —"] + ref_data.branches, index=0, key="meta_branch_select")
 
 # -------- FORM --------
 st.markdown('<div class="card">', unsafe_allow_html=True)
@@ -422,7 +671,7 @@ with st.form("quality_form", clear_on_submit=False):
     with col1:
         chef_options = ["— בחר —"]
         if selected_branch and selected_branch != "— בחר —":
-            chef_options += CHEFS_BY_BRANCH.get(selected_branch, [])
+            chef_options += ref_data.chefs_by_branch.get(selected_branch, [])
         chef_choice = st.selectbox("שם הטבח (מרשימה)", options=chef_options, index=0, key="chef_from_list")
 
     with col2:
@@ -430,7 +679,7 @@ with st.form("quality_form", clear_on_submit=False):
 
     colA, colB = st.columns(2)
     with colA:
-        dish = st.selectbox("שם המנה *", options=["— בחר —"] + DISHES, index=0)
+        dish = st.selectbox("שם המנה *", options=["— בחר —"] + ref_data.dishes, index=0)
     with colB:
         score_choice = st.selectbox(
             "ציון איכות *",
@@ -462,67 +711,86 @@ if submitted:
 # =========================
 # --- WEEKLY / BRANCH -----
 # =========================
-def weekly_branch_params(df: pd.DataFrame, branch: str,
-                         min_chef: int = MIN_CHEF_WEEK_M,
-                         min_dish: int = MIN_DISH_WEEK_M) -> Dict[str, Any]:
-    if df.empty:
-        return {"avg": (None, None), "best_chef": ((None, None),(None, None)),
-                "worst": (None, None), "best_dish_name": (None, None),
-                "worst_dish_name": (None, None), "n_week": 0, "n_last": 0}
-    d = df[df["branch"] == branch].copy()
-    if d.empty:
-        return {"avg": (None, None), "best_chef": ((None, None),(None, None)),
-                "worst": (None, None), "best_dish_name": (None, None),
-                "worst_dish_name": (None, None), "n_week": 0, "n_last": 0}
+EMPTY_WEEKLY: Dict[str, Any] = {"avg": (None, None), "best_chef": ((None, None),(None, None)),
+                                 "worst": (None, None), "best_dish_name": (None, None),
+                                 "worst_dish_name": (None, None), "n_week": 0, "n_last": 0}
+
+def _chef_best_worst(g: Optional[pd.DataFrame], min_count: int
+                     ) -> Tuple[Tuple[Optional[str], Optional[float]], Tuple[Optional[str], Optional[float]]]:
+    if g is None: return (None, None), (None, None)
+    g = g[g["n"] >= min_count]
+    if g.empty: return (None, None), (None, None)
+    best, worst = g["avg"].idxmax(), g["avg"].idxmin()
+    return (str(best), float(g.at[best, "avg"])), (str(worst), float(g.at[worst, "avg"]))
+
+def _dish_best_worst(g: Optional[pd.DataFrame], min_count: int) -> Tuple[Optional[str], Optional[str]]:
+    if g is None: return None, None
+    g = g[g["n"] >= min_count]
+    if g.empty: return None, None
+    best, worst = str(g["avg"].idxmax()), str(g["avg"].idxmin())
+    if best == worst: return best, None
+    return best, worst
+
+def data_key(df: pd.DataFrame) -> Tuple[int, int, str]:
+    # מפתח זול לתמונת נתונים: מספר שורות, id מקסימלי והיום (גבול השבוע זז רק בחצות)
+    last_id = int(df["id"].max()) if not df.empty else 0
+    return len(df), last_id, pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d")
 
+@st.cache_data(ttl=15)
+def _weekly_params_by_branch(_df: pd.DataFrame, key: Tuple[int, int, str],
+                             min_chef: int, min_dish: int) -> Dict[str, Dict[str, Any]]:
+    df = _df
+    if df.empty: return {}
     now = pd.Timestamp.now(tz="UTC")
     w_start = (now - pd.Timedelta(days=int(now.dayofweek))).normalize()
     w_end = w_start + pd.Timedelta(days=7)
     lw_start = w_start - pd.Timedelta(days=7)
     lw_end = w_start
 
-    sw  = d[(d["created_at"] >= w_start)  & (d["created_at"] < w_end)]
-    slw = d[(d["created_at"] >= lw_start) & (d["created_at"] < lw_end)]
-
-    avg_w  = float(sw["score"].mean())  if not sw.empty  else None
-    avg_lw = float(slw["score"].mean()) if not slw.empty else None
-
-    def _chef_best_worst(frame: pd.DataFrame, min_count: int
-                         ) -> Tuple[Tuple[Optional[str], Optional[float]], Tuple[Optional[str], Optional[float]]]:
-        if frame.empty: return (None, None), (None, None)
-        g = frame.groupby("chef_name").agg(n=("id","count"), avg=("score","mean")).reset_index()
-        g = g[g["n"] >= min_count]
-        if g.empty: return (None, None), (None, None)
-        best_row  = g.loc[g["avg"].idxmax()]
-        worst_row = g.loc[g["avg"].idxmin()]
-        return (str(best_row["chef_name"]), float(best_row["avg"])), (str(worst_row["chef_name"]), float(worst_row["avg"]))
-
-    def _dish_best_worst(frame: pd.DataFrame, min_count: int) -> Tuple[Optional[str], Optional[str]]:
-        if frame.empty: return None, None
-        g = frame.groupby("dish_name").agg(n=("id","count"), avg=("score","mean")).reset_index()
-        g = g[g["n"] >= min_count]
-        if g.empty: return None, None
-        best_row  = g.loc[g["avg"].idxmax()]
-        worst_row = g.loc[g["avg"].idxmin()]
-        best, worst = str(best_row["dish_name"]), str(worst_row["dish_name"])
-        if best == worst: return best, None
-        return best, worst
-
-    (best_name_w, best_avg_w), (best_name_lw, best_avg_lw) = _chef_best_worst(sw,  MIN_CHEF_WEEK_M)
-    best_dish_name_w,  worst_dish_name_w  = _dish_best_worst(sw,  MIN_DISH_WEEK_M)
-    best_dish_name_lw, worst_dish_name_lw = _dish_best_worst(slw, MIN_DISH_WEEK_M)
-
-    worst_w = float(sw.groupby("chef_name")["score"].mean().min()) if not sw.empty else None
-    worst_lw = float(slw.groupby("chef_name")["score"].mean().min()) if not slw.empty else None
-
-    return {
-        "avg": (avg_w, avg_lw),
-        "best_chef": ((best_name_w, best_avg_w), (best_name_lw, best_avg_lw)),
-        "worst": (worst_w, worst_lw),
-        "best_dish_name": (best_dish_name_w, best_dish_name_lw),
-        "worst_dish_name": (worst_dish_name_w, worst_dish_name_lw),
-        "n_week": int(len(sw)), "n_last": int(len(slw)),
-    }
+    sw  = df[(df["created_at"] >= w_start)  & (df["created_at"] < w_end)]
+    slw = df[(df["created_at"] >= lw_start) & (df["created_at"] < lw_end)]
+
+    def by(frame: pd.DataFrame, col: str) -> Dict[str, pd.DataFrame]:
+        g = (frame.groupby(["branch", col], observed=True)["score"].agg(["count", "mean"])
+             .rename(columns={"count": "n", "mean": "avg"}))
+        return {str(b): g.xs(b, level=0) for b in g.index.get_level_values(0).unique()}
+
+    tot_w  = sw.groupby("branch", observed=True)["score"].agg(["mean", "count"])
+    tot_lw = slw.groupby("branch", observed=True)["score"].agg(["mean", "count"])
+    chef_w, chef_lw = by(sw, "chef_name"), by(slw, "chef_name")
+    dish_w, dish_lw = by(sw, "dish_name"), by(slw, "dish_name")
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for branch in set(map(str, tot_w.index)) | set(map(str, tot_lw.index)):
+        avg_w  = float(tot_w.at[branch, "mean"])  if branch in tot_w.index  else None
+        avg_lw = float(tot_lw.at[branch, "mean"]) if branch in tot_lw.index else None
+        (best_name_w, best_avg_w), (best_name_lw, best_avg_lw) = _chef_best_worst(chef_w.get(branch), min_chef)
+        best_dish_name_w,  worst_dish_name_w  = _dish_best_worst(dish_w.get(branch),  min_dish)
+        best_dish_name_lw, worst_dish_name_lw = _dish_best_worst(dish_lw.get(branch), min_dish)
+        worst_w  = float(chef_w[branch]["avg"].min())  if branch in chef_w  else None
+        worst_lw = float(chef_lw[branch]["avg"].min()) if branch in chef_lw else None
+        out[branch] = {
+            "avg": (avg_w, avg_lw),
+            "best_chef": ((best_name_w, best_avg_w), (best_name_lw, best_avg_lw)),
+            "worst": (worst_w, worst_lw),
+            "best_dish_name": (best_dish_name_w, best_dish_name_lw),
+            "worst_dish_name": (worst_dish_name_w, worst_dish_name_lw),
+            "n_week": int(tot_w.at[branch, "count"]) if branch in tot_w.index else 0,
+            "n_last": int(tot_lw.at[branch, "count"]) if branch in tot_lw.index else 0,
+        }
+    return out
+
+def weekly_params_by_branch(df: pd.DataFrame,
+                            min_chef: int = MIN_CHEF_WEEK_M,
+                            min_dish: int = MIN_DISH_WEEK_M) -> Dict[str, Dict[str, Any]]:
+    """סיכום שבועי לכל הסניפים במעבר groupby אחד (במקום סינון וקיבוץ של כל הטבלה לכל סניף).
+    נשמר ב-cache לפי data_key – בלי לגבב את ה-DataFrame עצמו."""
+    return _weekly_params_by_branch(df, data_key(df), min_chef, min_dish)
+
+def weekly_branch_params(df: pd.DataFrame, branch: str,
+                         min_chef: int = MIN_CHEF_WEEK_M,
+                         min_dish: int = MIN_DISH_WEEK_M) -> Dict[str, Any]:
+    return weekly_params_by_branch(df, min_chef, min_dish).get(branch, EMPTY_WEEKLY)
 
 def wow_delta(curr: Optional[float], prev: Optional[float]) -> str:
     if curr is None and prev is None: return "—"
@@ -535,8 +803,7 @@ def wow_delta(curr: Optional[float], prev: Optional[float]) -> str:
 def fmt_num(v: Optional[float]) -> str:
     return "—" if v is None else f"<span class='num-green'>{v:.2f}</span>"
 
-def render_weekly_summary_for_branch(df: pd.DataFrame, branch: str):
-    m = weekly_branch_params(df, branch, MIN_CHEF_WEEK_M, MIN_DISH_WEEK_M)
+def render_weekly_summary_for_branch(m: Dict[str, Any]):
     avg_w,  avg_lw  = m["avg"]
     (best_name_w, best_avg_w), (best_name_lw, best_avg_lw) = m["best_chef"]
     worst_w, worst_lw = m["worst"]
@@ -606,6 +873,7 @@ if auth["role"] == "meta" and not df.empty:
 
     g = network_branch_avgs_last7(df)
     if not g.empty:
+        import altair as alt
         light_palette = ["#cfe8ff", "#d7fde7", "#fde2f3", "#fff3bf",
                          "#e5e1ff", "#c9faf3", "#ffdede", "#eaf7e5"]
         x_axis = alt.Axis(labelAngle=0, labelPadding=6, labelColor='#111', title=None,
@@ -627,8 +895,8 @@ if auth["role"] == "meta" and not df.empty:
     else:
         st.info("אין מספיק נתונים לגרף סניפים.")
 
-    chef, chef_branch, chef_avg, chef_n = network_top_chef_last7(df, MIN_CHEF_WEEK_M)
-    best_dish, worst_dish = network_best_worst_dish_last7(df, MIN_DISH_WEEK_M)
+    chef, chef_branch, chef_avg, chef_n = network_top_chef_last7()
+    best_dish, worst_dish = network_best_worst_dish_last7()
 
     def line(name, value):
         st.markdown(f"- **{name}:** {value}", unsafe_allow_html=True)
@@ -644,16 +912,30 @@ if auth["role"] == "meta" and not df.empty:
 
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown("### סיכום שבועי לפי סניף")
-    for b in BRANCHES:
+    weekly = weekly_params_by_branch(df, MIN_CHEF_WEEK_M, MIN_DISH_WEEK_M)
+    for b in ref_data.branches:
         with st.expander(b, expanded=False):
-            render_weekly_summary_for_branch(df, b)
+            render_weekly_summary_for_branch(weekly.get(b, EMPTY_WEEKLY))
     st.markdown('</div>', unsafe_allow_html=True)
 
+# --- META: הוספת טבח לסניף (בלי פריסה מחדש) ---
+if auth["role"] == "meta":
+    with st.expander("הוספת טבח לסניף", expanded=False):
+        with st.form("add_chef_form", clear_on_submit=True):
+            new_branch = st.selectbox("סניף", options=["— בחר —"] + ref_data.branches, index=0)
+            new_chef = st.text_input("שם הטבח", value="")
+            if st.form_submit_button("הוסף"):
+                if new_branch == "— בחר —" or not norm_name(new_chef):
+                    st.error("נא לבחור סניף ולהזין שם טבח.")
+                else:
+                    register_chef(new_branch, new_chef)
+                    st.success("הטבח נוסף לרשימת הסניף.")
+
 # --- BRANCH weekly summary ---
 if auth["role"] == "branch" and not df.empty:
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown(f"### סיכום שבועי — {auth['branch']}")
-    render_weekly_summary_for_branch(df, auth["branch"])
+    render_weekly_summary_for_branch(weekly_branch_params(df, auth["branch"], MIN_CHEF_WEEK_M, MIN_DISH_WEEK_M))
     st.markdown('</div>', unsafe_allow_html=True)
 
 # =========================
@@ -667,30 +949,124 @@ def df_to_csv_for_llm(df_in: pd.DataFrame, max_rows: int = 400) -> str:
     if len(d) > max_rows: d = d.head(max_rows)
     return d.to_csv(index=False)
 
-def call_openai(user_prompt: str) -> str:
+class ProviderUnavailable(Exception):
+    """הספק לא מוגדר בסביבה (למשל חסר מפתח) – עוברים לספק הבא בלי להשהות אותו."""
+
+def call_openai(user_prompt: str, timeout: float = LLM_BUDGET_S["openai"]) -> str:
     try:
         from openai import OpenAI
-        api_key   = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
-        org_id    = st.secrets.get("OPENAI_ORG") or os.getenv("OPENAI_ORG")
-        project   = st.secrets.get("OPENAI_PROJECT") or os.getenv("OPENAI_PROJECT")
-        model     = st.secrets.get("OPENAI_MODEL") or os.getenv("OPENAI_MODEL") or "gpt-4.1-mini"
-        if not api_key: return "חסר מפתח OPENAI_API_KEY (ב-Secrets/Environment)."
-        client_kwargs = {"api_key": api_key}
-        if org_id:  client_kwargs["organization"] = org_id
-        if project: client_kwargs["project"] = project
-        client = OpenAI(**client_kwargs)
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content":
-                 "אתה אנליסט דאטה דובר עברית. מוצגת לך טבלה עם העמודות: id, branch, chef_name, dish_name, score, notes, created_at. ענה בתמציתיות עם תובנות והמלצות קצרות."},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.2,
-        )
-        return (resp.choices[0].message.content or "").strip()
-    except Exception as e:
-        return f"שגיאה בקריאה ל-OpenAI: {e}"
+    except ImportError:
+        raise ProviderUnavailable("חבילת openai לא מותקנת.")
+    api_key   = get_setting("OPENAI_API_KEY")
+    org_id    = get_setting("OPENAI_ORG")
+    project   = get_setting("OPENAI_PROJECT")
+    model     = get_setting("OPENAI_MODEL") or "gpt-4.1-mini"
+    if not api_key: raise ProviderUnavailable("חסר מפתח OPENAI_API_KEY (ב-Secrets/Environment).")
+    client_kwargs = {"api_key": api_key, "timeout": timeout, "max_retries": 0}
+    if org_id:  client_kwargs["organization"] = org_id
+    if project: client_kwargs["project"] = project
+    client = OpenAI(**client_kwargs)
+    resp = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content":
+             "אתה אנליסט דאטה דובר עברית. מוצגת לך טבלה עם העמודות: id, branch, chef_name, dish_name, score, notes, created_at. ענה בתמציתיות עם תובנות והמלצות קצרות."},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.2,
+    )
+    return (resp.choices[0].message.content or "").strip()
+
+def local_summary(df_in: pd.DataFrame) -> str:
+    """סיכום דטרמיניסטי (מגמות, חריגים, המלצות) מתוך פונקציות ה-KPI – בלי רשת."""
+    d = last7(df_in)
+    if d.empty: return "אין בדיקות ב-7 הימים האחרונים – אין על מה לסכם."
+    avg_now = float(d["score"].mean())
+    p = prev7(df_in)
+    avg_prev = float(p["score"].mean()) if not p.empty else None
+
+    trends, outliers, recs = [], [], []
+    trends.append(f"ממוצע רשת (7 ימים): {avg_now:.2f} · N={len(d)} · מול השבוע הקודם: {wow_delta(avg_now, avg_prev)}")
+    g = network_branch_avgs_last7(df_in)
+    if len(g) > 1:
+        top, bottom = g.iloc[0], g.iloc[-1]
+        trends.append(f"סניף מוביל: {top['branch']} ({top['avg']:.2f}) · סניף חלש: {bottom['branch']} ({bottom['avg']:.2f})")
+    chef, chef_branch, chef_avg, chef_n = network_top_chef_last7()
+    if chef is not None:
+        trends.append(f"טבח מוביל: {chef} · {chef_branch or ''} · {chef_avg:.2f} (N={chef_n})")
+
+    for _, r in g.iterrows():
+        if abs(r["avg"] - avg_now) >= 1.0:
+            outliers.append(f"סניף {r['branch']} חורג מממוצע הרשת: {r['avg']:.2f} ({r['avg'] - avg_now:+.2f})")
+    low = d[d["score"] <= 3]
+    if not low.empty:
+        top_low = low.groupby(["branch", "dish_name"], observed=True)["id"].count().sort_values(ascending=False).head(3)
+        outliers.append(f"{len(low)} ציונים חלשים (≤3): " +
+                        ", ".join(f"{dish} ב{branch} ×{n}" for (branch, dish), n in top_low.items()))
+
+    best_dish, worst_dish = network_best_worst_dish_last7()
+    if worst_dish is not None:
+        recs.append(f"לבדוק את המנה {worst_dish[0]} (ממוצע {worst_dish[1]:.2f}, N={worst_dish[2]}) מול המתכון והספקים.")
+    if len(g) > 1 and g.iloc[-1]["avg"] < avg_now:
+        recs.append(f"ביקור מטה בסניף {g.iloc[-1]['branch']} וריענון נהלים מול המטבח.")
+    if chef is not None:
+        recs.append(f"לשתף את שיטות העבודה של {chef} עם טבחי הרשת.")
+    if best_dish is not None:
+        recs.append(f"לשמר את הרמה במנה {best_dish[0]} ({best_dish[1]:.2f}).")
+    if avg_prev is not None and avg_now < avg_prev:
+        recs.append("מגמת ירידה בממוצע הרשת – להגביר בדיקות בשבוע הקרוב.")
+
+    def section(title: str, rows: List[str]) -> str:
+        return f"**{title}**\n" + ("\n".join(f"- {r}" for r in rows) if rows else "- —")
+
+    return "\n\n".join([section("מגמות", trends), section("חריגים", outliers), section("המלצות", recs)])
+
+def _openai_provider(user_prompt: str, df_in: pd.DataFrame, timeout: Optional[float], question: bool) -> str:
+    return call_openai(user_prompt, timeout=timeout)
+
+def _local_provider(user_prompt: str, df_in: pd.DataFrame, timeout: Optional[float], question: bool) -> str:
+    if question:
+        raise ProviderUnavailable("ניתוח מקומי מפיק רק סיכום מגמות – אין מענה לשאלות חופשיות בלי OpenAI.")
+    return local_summary(df_in)
+
+LLM_PROVIDERS: Dict[str, Callable[[str, pd.DataFrame, Optional[float], bool], str]] = {
+    "openai": _openai_provider,
+    "local": _local_provider,
+}
+
+def llm_provider_order() -> List[str]:
+    # LLM_PROVIDER=openai/local מקבע ספק ראשון; ברירת מחדל – OpenAI ואז מקומי
+    first = (get_setting("LLM_PROVIDER") or "openai").strip().lower()
+    if first not in LLM_PROVIDERS: first = "openai"
+    return [first] + [p for p in LLM_PROVIDERS if p != first]
+
+def call_llm(user_prompt: str, df_in: pd.DataFrame, question: bool = False) -> str:
+    """מנסה ספקים לפי הסדר; ספק מרוחק שנכשל או חרג מהתקציב מושהה ל-LLM_COOLDOWN_S ועוברים לבא.
+    question=True – שאלה חופשית; הספק המקומי לא עונה עליה ומחזיר הודעה מפורשת."""
+    cooldown: Dict[str, float] = st.session_state.setdefault("llm_cooldown", {})
+    errors: List[str] = []
+    for name in llm_provider_order():
+        if cooldown.get(name, 0) > time.time():
+            errors.append(f"{name}: מושהה לאחר כשל קודם")
+            continue
+        budget = LLM_BUDGET_S.get(name)
+        t0 = time.perf_counter()
+        try:
+            ans = LLM_PROVIDERS[name](user_prompt, df_in, budget, question)
+        except ProviderUnavailable as e:
+            errors.append(f"{name}: {e}")
+            continue
+        except Exception as e:
+            if budget is not None:
+                cooldown[name] = time.time() + LLM_COOLDOWN_S
+            errors.append(f"{name}: {e}")
+            continue
+        if budget is not None and time.perf_counter() - t0 > budget:
+            cooldown[name] = time.time() + LLM_COOLDOWN_S
+        if errors and name == "local":
+            ans = f"_סיכום מקומי ({'; '.join(errors)})_\n\n{ans}"
+        return ans
+    return "שגיאה בניתוח: " + "; ".join(errors)
 
 df2 = load_df()
 if not df2.empty:
@@ -698,7 +1074,7 @@ if not df2.empty:
         table_csv = df_to_csv_for_llm(df2)
         up = f"הנה הטבלה בפורמט CSV:\n{table_csv}\n\nסכם מגמות, חריגים והמלצות קצרות לניהול."
         with st.spinner("מנתח..."):
-            ans = call_openai(up)
+            ans = call_llm(up, df2)
         st.write(ans)
 else:
     st.info("אין נתונים לניתוח עדיין.")
@@ -716,7 +1092,7 @@ if st.button("שלח"):
             f"ענה בעברית ותן נימוק קצר לכל מסקנה."
         )
         with st.spinner("מנתח..."):
-            ans = call_openai(up)
+            ans = call_llm(up, df2, question=True)
         st.write(ans)
     elif df2.empty:
         st.warning("אין נתונים לניתוח כרגע.")
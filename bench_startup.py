@@ -0,0 +1,86 @@
+# bench_startup.py — מדידת זמן עלייה קר (תהליך חדש) וזמן rerun של app.py, עם תקציבים
+#   python bench_startup.py [--rows 3000] [--reruns 20] [--cold-budget-ms 4000] [--rerun-budget-ms 300]
+# ה-DB הזמני נזרע ב---rows בדיקות מ-21 הימים האחרונים, כדי שעמוד המטה ימדוד KPI, גרף ולוח דירוג.
+# יוצא עם קוד 1 אם אחד החציונים חורג מהתקציב.
+# מדידה על מכונת פיתוח (ליבה אחת, 3000 שורות): עלייה קרה ~1-1.5s, rerun חציוני ~70ms (פתיחה) / ~100-140ms (מטה);
+# ברירות המחדל משאירות מרווח של פי 2-3 לרעש של סביבות CI.
+from __future__ import annotations
+import argparse, os, random, sqlite3, statistics, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+def _app_test(role: str):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP, default_timeout=60)
+    if role == "meta":
+        at.session_state["auth"] = {"role": "meta", "branch": None}
+    return at
+
+def child(role: str):
+    # תהליך נקי: כולל import של streamlit/pandas, מיגרציית DB ובניית ה-HTML הסטטי
+    t0 = time.perf_counter()
+    at = _app_test(role)
+    at.run()
+    print(f"{(time.perf_counter() - t0) * 1000:.1f}")
+
+def cold_start_ms(role: str, workdir: str) -> float:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", role],
+                         cwd=workdir, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def seed_db(workdir: str, rows: int):
+    # ריצה ראשונה יוצרת את הסכמה והמימדים (init_db); אחריה מזינים בדיקות לפי רשימות הסניפים
+    cold_start_ms("landing", workdir)
+    rnd = random.Random(0)
+    c = sqlite3.connect(os.path.join(workdir, "food_quality.db"))
+    roster = c.execute("SELECT branch_id, chef_id FROM chef_branches").fetchall()
+    dishes = [r[0] for r in c.execute("SELECT id FROM dishes")]
+    now = datetime.utcnow()
+    batch = []
+    for _ in range(rows):
+        branch_id, chef_id = rnd.choice(roster)
+        ts = now - timedelta(seconds=rnd.randint(0, 21 * 24 * 3600))
+        batch.append((branch_id, chef_id, rnd.choice(dishes), rnd.randint(1, 10), "",
+                      ts.strftime("%Y-%m-%d %H:%M:%S"), "bench"))
+    c.executemany("INSERT INTO food_quality (branch_id, chef_id, dish_id, score, notes, created_at, submitted_by) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+    c.commit(); c.close()
+
+def rerun_ms(role: str, n: int) -> list:
+    at = _app_test(role)
+    at.run()
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        at.run()
+        times.append((time.perf_counter() - t0) * 1000)
+    return times
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--child", choices=["landing", "meta"])
+    ap.add_argument("--rows", type=int, default=3000)
+    ap.add_argument("--reruns", type=int, default=20)
+    ap.add_argument("--cold-budget-ms", type=float, default=4000)
+    ap.add_argument("--rerun-budget-ms", type=float, default=300)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.child)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # food_quality.db נוצר בתיקייה זמנית
+        seed_db(workdir, args.rows)
+        for role in ("landing", "meta"):
+            cold = cold_start_ms(role, workdir)
+            runs = rerun_ms(role, args.reruns)
+            med = statistics.median(runs)
+            print(f"{role:8s} cold={cold:8.1f}ms  rerun median={med:7.1f}ms  max={max(runs):7.1f}ms")
+            if cold > args.cold_budget_ms or med > args.rerun_budget_ms:
+                print(f"  ✗ {role}: חריגה מהתקציב")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()